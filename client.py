@@ -1,10 +1,18 @@
 # Imports and declarations
-import socket
+import asyncio
 import datetime
-import threading
+import os
 import sys
 import signal
-import time
+from protocol import frame_message, read_frames
+
+# Fixed terminal output
+HELP_TEXT = (
+    "A %connect command followed by the address and port number of a running bulletin board server to connect to.\n"
+    "An %exit command to exit the client program."
+)
+INVALID_COMMAND_TEXT = "Invalid command."
+NOT_CONNECTED_TEXT = "Please connect to a server first."
 
 
 class Client:
@@ -15,43 +23,57 @@ class Client:
         self.id = -1
         self.username = username
         self.group = group
-        self.client_socket = None
+        self.reader = None
+        self.writer = None
         self.client_running = False
-        # Thread for handling responses from the server.
-        self.cmd_thread = None
-        self.data_read = threading.Event()
-        self.cmd_kill_listener = threading.Event()
+        # Task for handling responses from the server.
+        self.recv_task = None
+        # Future resolved by the receive task once the server has answered a command.
+        self.pending = None
+        # Lines read from stdin by the event loop, or None when stdin is read in an executor thread.
+        self.stdin_lines = None
+        self.stdin_buffer = bytearray()
         self.recent_groups = ""
 
-    def client_shutdown(self, signum=None, frame=None):
+    async def client_shutdown(self):
         """Shutdown the client and disconnect them from server if need be."""
         self.client_running = False
         print("\nStarting shutdown...")
         # If we haven't been disconnected from the server yet, do so.
         if self.id > -1:
-            self.client_disconnect_from_server()
+            await self.client_disconnect_from_server()
         print("Done! See you later.")
-        sys.exit(0)
+        sys.stdout.flush()
+        # Where stdin can't be watched by the event loop, the terminal prompt may
+        # still be blocked on input() in an executor thread, which sys.exit would
+        # wait on. Exit without joining it.
+        os._exit(0)
 
-    def client_disconnect_from_server(self):
+    async def client_disconnect_from_server(self):
         """Disconnect client from the server."""
         # Send the exit command to the server telling them that we're either
         # just disconnecting from the server or fully shutting down the
         # client (the server doesn't care about this distinction though)
-        self.client_socket.send("exit".encode())
-        while not self.data_read.is_set():
-            time.sleep(0.1)
-        self.cmd_kill_listener.set()
-        self.cmd_thread.join()
-        self.client_socket.close()
+        await self.client_send_command("exit")
+        # The server closes the connection after replying, ending the receive task.
+        await self.recv_task
+        self.writer.close()
+        await self.writer.wait_closed()
         # Set the ID of the client to -1 to represent being disconnected
         self.id = -1
 
+    async def client_send_command(self, command):
+        """Send a command to the server and wait for the receive task to handle the response."""
+        self.pending = asyncio.get_running_loop().create_future()
+        self.writer.write(frame_message(command.encode()))
+        await self.writer.drain()
+        await self.pending
+
     def client_startup(self):
         """Start the client and create a socket and terminal prompt for interaction."""
         self.client_print_startup_message()
         self.client_running = True
-        self.client_terminal_prompt()
+        asyncio.run(self.client_terminal_prompt())
 
     def client_print_startup_message(self):
         """Startup message printed to the terminal."""
@@ -65,17 +87,39 @@ class Client:
         print("\n💡 TIP: use %help to view commands.")
         print("-------------------------------------")
 
-    def client_terminal_prompt(self):
+    async def client_terminal_prompt(self):
         """Main interaction loop for terminal."""
+        loop = asyncio.get_running_loop()
+        # Register the Ctrl+C handler on the event loop, so an IMMEDIATE
+        # client shutdown can still disconnect from the server.
+        try:
+            loop.add_signal_handler(signal.SIGINT, lambda: loop.create_task(self.client_shutdown()))
+        except NotImplementedError:
+            # Windows event loops don't support signal handlers.
+            signal.signal(
+                signal.SIGINT,
+                lambda signum, frame: loop.call_soon_threadsafe(lambda: loop.create_task(self.client_shutdown())),
+            )
+
+        # Watch a terminal's stdin on the event loop alongside the server connection.
+        # Piped stdin may already be read ahead into sys.stdin's buffer, where the
+        # loop can't see it, and Windows event loops can't watch stdin at all.
+        if sys.stdin.isatty():
+            self.stdin_lines = asyncio.Queue()
+            try:
+                loop.add_reader(sys.stdin.fileno(), self._on_stdin_readable)
+            except NotImplementedError:
+                self.stdin_lines = None
+
         while self.client_running is True:
-            u_input = input("> ")
+            # Read stdin without blocking the receive task.
+            u_input = await self.client_read_input("> ")
             # Parse user command, in case of parameters.
-            u_command = u_input.split(" ")[0]
-            u_parameters = u_input.split(" ")[1:]
+            u_command, *u_parameters = u_input.split(" ")
 
             # Make sure the command starts with the right prefix.
             if not u_command.startswith(self.prefix):
-                print("Invalid command.")
+                print(INVALID_COMMAND_TEXT)
             elif self.id < 0 and u_command[1:] not in ["help", "connect", "exit"]:
                 # Connection to server has not been made yet--only commands that should work are help, connect, and exit.
                 print(
@@ -87,12 +131,9 @@ class Client:
                 match u_command[1:]:
                     case "help":
                         if self.id > -1:
-                            self.client_socket.send(u_command[1:].encode())
+                            await self.client_send_command(u_command[1:])
                         else:
-                            print(
-                                "A %connect command followed by the address and port number of a running bulletin board server to connect to.\n"
-                                "An %exit command to exit the client program."
-                            )
+                            print(HELP_TEXT)
                     case "connect":
                         if self.id > -1:
                             # The client has already been assigned an ID, ignore the request to connect until disconnected from current server.
@@ -110,74 +151,91 @@ class Client:
                                 host = str(u_parameters[0])
                                 port = int(u_parameters[1])
                                 print("Connecting to %s:%d..." % (host, port))
-                                # Instantiate a socket for the client
-                                self.client_socket = socket.socket()
-                                self.client_socket.connect((host, port))
-                                # Start the command processing thread.
-                                self.cmd_kill_listener.clear()
-                                self.cmd_thread = threading.Thread(target=self.client_read_server_response)
-                                self.cmd_thread.start()
+                                # Open a connection for the client
+                                self.reader, self.writer = await asyncio.open_connection(host, port)
+                                # Start the command processing task.
+                                self.recv_task = asyncio.create_task(self._recv_loop(self.reader))
                                 # Client has been connected, send username and group if applicable.
-                                self.client_socket.send(
-                                    (self.username + " " + self.group).encode()
-                                )
                                 # Wait for the ID to be set.
-                                while not self.data_read.is_set():
-                                    time.sleep(0.1)
+                                await self.client_send_command(self.username + " " + self.group)
                                 # Print message to client terminal.
                                 print(
                                     "Success! Connected to %s:%s as ID #%d."
                                     % (host, port, self.id)
                                 )
                                 print(self.recent_groups)
-                                self.data_read.clear()
 
                     case "exit":
                         if self.id > -1:
                             # If client is connect, exit just connects from server
-                            self.client_disconnect_from_server()
+                            await self.client_disconnect_from_server()
                         else:
                             # If user is not connected to a server (ID == -1),
                             # init the client shutdown from here.
-                            self.client_shutdown()
+                            await self.client_shutdown()
                     case _:
                         if self.id > -1:
-                            command_str = u_command[1:]
-                            for param in u_parameters:
-                                command_str += " %s" % param
-                            self.client_socket.send(command_str.encode())
+                            # Send the command as typed, without the prefix.
                             # Wait for the server to respond and wait for the
                             # client to read the data.
-                            while not self.data_read.is_set():
-                                time.sleep(0.1)
-                            self.data_read.clear()
+                            await self.client_send_command(u_input[1:])
                         else:
-                            print("Please connect to a server first.")
+                            print(NOT_CONNECTED_TEXT)
+
+    async def client_read_input(self, prompt):
+        """Read a line from stdin without blocking the event loop."""
+        if self.stdin_lines is None:
+            # Fall back to a blocking read in an executor thread.
+            return await asyncio.get_running_loop().run_in_executor(None, input, prompt)
+        print(prompt, end="", flush=True)
+        line = await self.stdin_lines.get()
+        if line is None:
+            raise EOFError
+        return line
+
+    def _on_stdin_readable(self):
+        """Queue each complete line typed on stdin."""
+        data = os.read(sys.stdin.fileno(), 4096)
+        if not data:
+            # End of input
+            asyncio.get_running_loop().remove_reader(sys.stdin.fileno())
+            self.stdin_lines.put_nowait(None)
+            return
+        self.stdin_buffer += data
+        *lines, self.stdin_buffer = self.stdin_buffer.split(b"\n")
+        for line in lines:
+            self.stdin_lines.put_nowait(line.decode().rstrip("\r"))
 
-    def client_read_server_response(self):
+    async def _recv_loop(self, reader):
         """Read response from server and print to terminal."""
-        # if the client is running,
-        while not self.cmd_kill_listener.is_set():
+        # Until the server closes the connection, accepting replies of any
+        # size, as the server can send back more than a single command holds,
+        async for frame in read_frames(reader, max_size=None):
             # we constantly check for data being sent from the server.
-            data = self.client_socket.recv(1024).decode()
             # If we have data that starts with "id ", this is from
             # the server response containing our client ID on connect.
-            if data.startswith("id "):
+            if frame.startswith(b"id "):
                 # Read the data and set the client ID.
+                data = frame.decode()
                 self.id = int(data.split(" ")[1])
                 # Print the example groups 
                 self.recent_groups = (" ".join(data.split(" ")[2:]))
-                # Resume command input--data has been handled
-                self.data_read.set()
-            # All other non-nothing data is sent here.
-            elif data:
+            # All other data is sent here.
+            else:
                 # Print whatever the result of the command was recieved
                 # as data from the server.
-                print(data)
-                # Resume command input--data has been handled
-                self.data_read.set()
+                print(frame.decode())
+            # Resume command input--data has been handled
+            self._resolve_pending()
+        # Don't leave command input waiting on a closed connection.
+        self._resolve_pending()
         return 0
 
+    def _resolve_pending(self):
+        """Wake up the terminal prompt if it is waiting on a server response."""
+        if self.pending is not None and not self.pending.done():
+            self.pending.set_result(None)
+
 
 def main():
     # Get input from user, username and group
@@ -188,12 +246,10 @@ def main():
     if group == "":
         group = "default"
     client = Client(username, group)
-    # Register the Ctrl+C signal handler
+    # Start client (this also registers the Ctrl+C signal handler).
     # Here we're doing an IMMEDIATE client shutdown on Ctrl+C,
     # where the user will be disconnected from the server in the event
     # that they haven't disconnected before sending Ctrl+C.
-    signal.signal(signal.SIGINT, client.client_shutdown)
-    # Start client
     client.client_startup()
 
     # End execution (client has been shut down, as the only way
@@ -0,0 +1,35 @@
+# Message framing shared by the client and server.
+# Every message is sent as a 4-byte big-endian length followed by that many
+# bytes of payload, so commands survive TCP splitting or merging them.
+import asyncio
+
+# Size of the length prefix in bytes. 4 bytes covers any reply the server can build,
+# such as a long post or member list, without overflowing.
+FRAME_HEADER_SIZE = 4
+# Largest message accepted by default. A peer can claim any length up to 4 GiB,
+# and the stream buffers the whole frame before it is handed over.
+MAX_FRAME_SIZE = 1 << 20
+
+
+def frame_message(message):
+    """Prefix an encoded message with its length."""
+    return len(message).to_bytes(FRAME_HEADER_SIZE, "big") + message
+
+
+async def read_frames(reader, max_size=MAX_FRAME_SIZE):
+    """Yield each complete message received on a stream.
+    Frames are sliced straight out of the stream's own read buffer, so one
+    socket read can drain many queued messages. Stops at a frame longer than
+    max_size (None for no limit), leaving the caller to close the connection.
+    """
+    while True:
+        try:
+            header = await reader.readexactly(FRAME_HEADER_SIZE)
+            size = int.from_bytes(header, "big")
+            if max_size is not None and size > max_size:
+                return
+            frame = await reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            # Connection closed, possibly in the middle of a frame.
+            return
+        yield frame
@@ -1,17 +1,57 @@
+import asyncio
 import socket
-import threading
 import signal
 import sys
 import json
+import os
 from os.path import exists
-import datetime
-import copy
-import select
 from datetime import date
+from protocol import frame_message, read_frames
 
 # Define the max number of connections
 MAX_CONNECTIONS = 5
 
+# Write-ahead log of changes to groups and boards since the last snapshot
+WAL_FILE = "obbs.wal"
+# Log set aside by a checkpoint until the snapshot that includes it is on disk
+WAL_CHECKPOINT_FILE = "obbs.wal.old"
+# Number of logged changes before the snapshot files are rewritten and the log is cleared
+WAL_CHECKPOINT_INTERVAL = 100
+# Number of logged changes between flushes of the write-ahead log to disk
+WAL_FSYNC_INTERVAL = 10
+
+# Fixed responses, encoded once at import
+HELP_MSG_BYTES = (
+    b"A %connect command followed by the address and port number of a running bulletin board server to connect to.\n"
+    b"A %join command to join the single message board.\n"
+    b"A %post command followed by the message subject and the message content or main body to post a message to the board.\n"
+    b"A %users command to retrieve a list of users in the same group.\n"
+    b"A %leave command to leave the group.\n"
+    b"A %message command followed by message ID to retrieve the content of the message.\n"
+    b"An %exit command to disconnect from the server and exit the client program.\n"
+    b"A %groups command to retrieve a list of all groups that can be joined.\n"
+    b"A %groupjoin command followed by the group id/name to join a specific group.\n"
+    b"A %grouppost command followed by the group id/name, the message subject, and the message content or main body to post a message to a message board owned by a specific group.\n"
+    b"A %groupusers command followed by the group id/name to retrieve a list of users in the given group.\n"
+    b"A %groupleave command followed by the group id/name to leave a specific group.\n"
+    b"A %groupmessage command followed by the group id/name and message ID to retrieve the content of the message posted earlier on a message board owned by a specific group."
+)
+MISSING_POST_ARGS_BYTES = b"Error: Missing subject or message."
+MISSING_MESSAGE_ID_BYTES = b"Error: Missing message ID."
+DISCONNECTED_BYTES = b"You have been disconnected from the server."
+MISSING_GROUPJOIN_ARGS_BYTES = b"Invalid %groupsjoin command. Please supply a group name to join."
+MISSING_GROUPPOST_ARGS_BYTES = b"Error: Missing group, subject, or message."
+INVALID_GROUP_BYTES = b"Error: Invalid group name."
+MISSING_GROUPMESSAGE_ARGS_BYTES = b"Error: Missing group ID or message ID."
+INVALID_COMMAND_BYTES = b"Invalid command."
+NOT_MEMBER_BYTES = b"Error: Client not member of group."
+MESSAGE_TOO_OLD_BYTES = b"Error: You are trying to access a message from too far in the past from when you joined the current group. (Limit: 2)"
+MESSAGE_NOT_FOUND_BYTES = b"Error: Message ID does not exist."
+
+# Commands whose last parameter is free text, mapped to the number of splits
+# needed so that text arrives as a single parameter
+PARAM_SPLITS = {b"post": 1, b"grouppost": 2}
+
 
 class Server:
     def __init__(self, host, port) -> None:
@@ -20,43 +60,132 @@ class Server:
         self.port = port
         self.client_ids = 0
         self.connected_clients = {}
-        self.groups = {"default": []}
+        self.groups = {"default": set()}
         self.boards = {"default": {}}
-        self.lock = threading.Lock()
-        self.running = True
+        # Connected client IDs for each group, so broadcasts only visit group members
+        self.group_sockets = {}
+        # Connected client IDs for each username, as group membership is by name
+        self.name_clients = {}
+        self.wal = None
+        self.wal_writes = 0
+        # Snapshot being written by an executor thread, if any
+        self.checkpointing = None
+        # Event loop, and the writer of every open connection keyed by its coroutine's task
+        self.loop = None
+        self.stopping = None
+        self.connections = {}
+        # Handler for each client command
+        self.dispatch = {
+            b"help": self._cmd_help,
+            b"join": self._cmd_join,
+            b"post": self._cmd_post,
+            b"users": self._cmd_users,
+            b"leave": self._cmd_leave,
+            b"message": self._cmd_message,
+            b"exit": self._cmd_exit,
+            b"groups": self._cmd_groups,
+            b"groupjoin": self._cmd_groupjoin,
+            b"grouppost": self._cmd_grouppost,
+            b"groupusers": self._cmd_groupusers,
+            b"groupleave": self._cmd_groupleave,
+            b"groupmessage": self._cmd_groupmessage,
+        }
 
 
     def default_serializer(self, obj):
         """Helper function to convert non-serializable objects to serializable ones."""
-        if isinstance(obj, date):
-            return obj.isoformat()
+        if isinstance(obj, (set, frozenset)):
+            return sorted(obj)
         raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
 
-    def server_shutdown(self, signum, frame):
-        """Shutdown server and save data for next startup."""
+    def server_shutdown(self, signum=None, frame=None):
+        """Shutdown server. Data is saved for next startup once the event loop has stopped."""
         print("\nCtrl+C pressed. Starting shutdown...")
-        self.running = False
-        # Shut down the process.
-        with open("groups.json", "w") as f:
-            json.dump(self.groups, f, indent=4, default=self.default_serializer)
-        with open("boards.json", "w") as f:
-            json.dump(self.boards, f, indent=4, default=self.default_serializer)
-        print("Done! See you later.")
-        sys.exit(0)
+        if self.loop is None:
+            # Nothing has been changed yet.
+            sys.exit(0)
+        # Safe to call from a signal handler.
+        self.loop.call_soon_threadsafe(self.stopping.set)
+
+    def serialize_snapshot(self):
+        """Encode groups and boards as they are now, ready to be written to disk."""
+        return [
+            (filename, json.dumps(data, separators=(",", ":"), default=self.default_serializer))
+            for filename, data in (("groups.json", self.groups), ("boards.json", self.boards))
+        ]
+
+    @staticmethod
+    def write_snapshot(snapshot):
+        """Durably replace the snapshot files, then drop the set-aside log they now include."""
+        # Write to a temporary file first so a crash mid-write can't corrupt the snapshot
+        for filename, text in snapshot:
+            with open(filename + ".tmp", "w") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(filename + ".tmp", filename)
+        # Make the renames durable too before dropping the log. Directories can't
+        # be opened on Windows, where os.replace is already durable.
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(".", os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        if exists(WAL_CHECKPOINT_FILE):
+            os.remove(WAL_CHECKPOINT_FILE)
+
+    def save_snapshot(self):
+        """Write groups and boards to disk and clear the write-ahead log they now include."""
+        self.write_snapshot(self.serialize_snapshot())
+        self.wal.truncate(0)
+        self.wal_writes = 0
+
+    def checkpoint(self):
+        """Start a new write-ahead log and write the snapshot in an executor thread,
+        so clients aren't stalled on disk I/O.
+        """
+        # The previous checkpoint hasn't finished yet. Try again on the next change.
+        if exists(WAL_CHECKPOINT_FILE):
+            return
+        # Set the current log aside. It is replayed at startup until the snapshot
+        # that includes it has been written.
+        self.wal.close()
+        os.replace(WAL_FILE, WAL_CHECKPOINT_FILE)
+        self.wal = open(WAL_FILE, "ab", buffering=0)
+        self.wal_writes = 0
+        # Encode on the event loop, as handlers keep changing groups and boards.
+        self.checkpointing = self.loop.run_in_executor(None, self.write_snapshot, self.serialize_snapshot())
+
+    def log_change(self, entry):
+        """Append a change to groups or boards to the write-ahead log."""
+        self.wal.write(json.dumps(entry, separators=(",", ":"), default=self.default_serializer).encode() + b"\n")
+        self.wal_writes += 1
+        if self.wal_writes % WAL_FSYNC_INTERVAL == 0:
+            os.fsync(self.wal.fileno())
+        if self.wal_writes >= WAL_CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def apply_change(self, entry):
+        """Replay a change read back from the write-ahead log."""
+        group = entry["group"]
+        match entry["op"]:
+            case "join":
+                self.groups.setdefault(group, set()).add(entry["name"])
+                self.boards.setdefault(group, {})
+            case "leave":
+                self.groups.get(group, set()).discard(entry["name"])
+            case "post":
+                self.boards.setdefault(group, {})[entry["id"]] = entry["msg"]
 
     def server_startup(self):
         """Startup server and restore data from previous shutdown."""
-        # Get instance of a socket for the server
-        self.server_socket = socket.socket()
-        # Bind host address and port
-        self.server_socket.bind((self.host, self.port))
-        # Set max amount of users to MAX_CONNECTIONS
-        self.server_socket.listen(MAX_CONNECTIONS)
-
         # Load groups and boards from previous shutdown
         if exists("groups.json"):
             with open("groups.json", "r") as f:
                 self.groups = json.load(f)
+        # Group members are stored as lists in JSON, but kept as sets in memory
+        self.groups = {group: set(members) for group, members in self.groups.items()}
         
         if exists("boards.json"):
             with open("boards.json", "r") as f:
@@ -64,143 +193,228 @@ class Server:
 
         self.boards = {key: {int(k): v for k, v in value.items()} for key, value in self.boards.items()}
 
+        # Replay changes made after the snapshot was saved, oldest first
+        for filename in (WAL_CHECKPOINT_FILE, WAL_FILE):
+            if exists(filename):
+                with open(filename, "r") as f:
+                    for line in f:
+                        # Skip a final line left incomplete by a crash
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+                        self.apply_change(entry)
+
+        # Member snapshots are stored as lists in JSON, but kept as frozensets in memory
+        for board in self.boards.values():
+            for message in board.values():
+                message["users_at_time_of_posting"] = frozenset(message["users_at_time_of_posting"])
+        self.wal = open(WAL_FILE, "ab", buffering=0)
+        # Save the replayed changes and start the log over, so new entries aren't
+        # appended to an incomplete line left by a crash.
+        self.save_snapshot()
+
+        # Serve every client from a single event loop. asyncio multiplexes all
+        # sockets through selectors.DefaultSelector (epoll/kqueue) on Linux and
+        # macOS, and through IOCP on Windows.
+        asyncio.run(self._serve())
+
+        # Shut down the process.
+        self.save_snapshot()
+        self.wal.close()
+        print("Done! See you later.")
+
+    async def _serve(self):
+        """Listen for incoming connections and hand each one to its own coroutine."""
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        # Save data on Ctrl+C. Not supported on Windows event loops, where the
+        # handler registered with signal.signal in main() is used instead.
+        try:
+            self.loop.add_signal_handler(signal.SIGINT, self.server_shutdown)
+        except NotImplementedError:
+            pass
+
+        # Bind host address and port, with a backlog of MAX_CONNECTIONS
+        server = await asyncio.start_server(
+            self.open_connection, self.host, self.port, backlog=MAX_CONNECTIONS
+        )
+
         # Listen for incoming connections
         print("Listening for connections on %s:%s..." % (self.host, self.port))
-        self.server_socket.listen()
-        while self.running:
-            try:
-                # Use select to make the loop non-blocking
-                ready_to_read, _, _ = select.select([self.server_socket], [], [], 1)
-                if ready_to_read:
-                    client_socket, client_address = self.server_socket.accept()
-                    threading.Thread(
-                        target=self.open_connection,
-                        args=(client_socket, client_address),
-                        daemon=True,
-                    ).start()
-            except OSError:
-                break
-
-    def open_connection(self, client_socket, client_address):
-        """Open a socket connection to a given client. Active on separate thread from main server execution."""
-        # Receive the client username and group
-        client_info = client_socket.recv(1024).decode()
-        client_name = client_info.split(" ")[0]
-        client_group = client_info.split(" ")[1]
-        client_id = self.client_ids
+        async with server:
+            await self.stopping.wait()
+            # Disconnect every client and let its coroutine finish, rather than
+            # having the event loop cancel it.
+            for writer in self.connections.values():
+                writer.close()
+            if self.connections:
+                await asyncio.wait(self.connections)
+        # Let a checkpoint in progress finish before the final snapshot is saved.
+        if self.checkpointing is not None:
+            await asyncio.wait((self.checkpointing,))
+
+    async def open_connection(self, reader, writer):
+        """Open a connection to a given client. Runs as a coroutine on the server's event loop.
+        Handlers only yield at an await, so they can mutate groups and boards without a lock.
+        """
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        client_id = None
+        try:
+            frames = read_frames(reader)
+            # Receive the client username and group
+            client_info = await anext(frames, None)
+            if client_info is None:
+                return
+            client_info = client_info.decode()
+            client_name = client_info.split(" ")[0]
+            client_group = client_info.split(" ")[1]
+            client_id = self.client_ids
         
         
-        # Announce that a client has been connected.
-        print("A client with ID #%d has connected, waiting for queries." % (client_id))
-
-        # Manage client, group, and board data
-        self.add_clients_groups(client_id, client_name, client_group, client_socket)
-
-        # Broadcast to all clients that a new client has joined
-        self.broadcast_client_join(client_id, client_name)
-
-        # List up to 5 groups when a user connects
-        example_groups = list(self.groups)[0:5]
-        if len(example_groups) > 0:
-            example_groups_message = " Current server groups: " + ", ".join(example_groups)
-            if len(example_groups) > 5:
-                example_groups_message += "..."
-
-        # Send client ID to client to confirm connection + exmaple groups
-        client_socket.send(("id " + str(client_id) + example_groups_message).encode())
-
-        # Handle client requests
-        while True:
-            data = client_socket.recv(1024).decode()
-            if not data:
-                break
-            command = data.split(" ")[0]
-            params = data.split(" ")[1:]
-            match command:
-                case "help":
-                    help_msg = (
-                        "A %connect command followed by the address and port number of a running bulletin board server to connect to.\n"
-                        "A %join command to join the single message board.\n"
-                        "A %post command followed by the message subject and the message content or main body to post a message to the board.\n"
-                        "A %users command to retrieve a list of users in the same group.\n"
-                        "A %leave command to leave the group.\n"
-                        "A %message command followed by message ID to retrieve the content of the message.\n"
-                        "An %exit command to disconnect from the server and exit the client program.\n"
-                        "A %groups command to retrieve a list of all groups that can be joined.\n"
-                        "A %groupjoin command followed by the group id/name to join a specific group.\n"
-                        "A %grouppost command followed by the group id/name, the message subject, and the message content or main body to post a message to a message board owned by a specific group.\n"
-                        "A %groupusers command followed by the group id/name to retrieve a list of users in the given group.\n"
-                        "A %groupleave command followed by the group id/name to leave a specific group.\n"
-                        "A %groupmessage command followed by the group id/name and message ID to retrieve the content of the message posted earlier on a message board owned by a specific group."
-                    )
-                    client_socket.send(help_msg.encode())
-                case "join":
-                    self.handle_join(client_id, "default")
-                case "post":
-                    if len(params) < 2:
-                        client_socket.send("Error: Missing subject or message.".encode())
-                        break
-                    self.handle_post(client_id, "default", *params)
-                case "users":
-                    group_users = ", ".join(self.groups["default"])
-                    client_socket.send(("Users in 'default': " + group_users).encode())
-                case "leave":
-                    self.handle_leave(client_id, "default")
-                case "message":
-                    if len(params) < 1:
-                        client_socket.send("Error: Missing message ID.".encode())
-                        break
-                    self.handle_message(client_id, "default", *params)
-                case "exit":
-                    # Remove the current user from the server.
-                    client_socket.send("You have been disconnected from the server.".encode())
-                    print("A client with ID #%d has disconnected from the server." % (client_id))
-                    # Close the client socket
-                    self.connected_clients[client_id]["client_socket"].close()
-                    # Remove the entry the current client in the connected clients list
-                    self.connected_clients.pop(client_id)
-                    # Return 0. This kills the thread for the current client request.
-                    return 0
-                case "groups":
-                    response = "Available groups: "
-                    for group in self.groups.keys():
-                        response += group + ", "
-                    client_socket.send(response[:-2].encode())
-                case "groupjoin":
-                    if len(params) != 1:
-                        client_socket.send("Invalid %groupsjoin command. Please supply a group name to join.".encode())
-                        break
-                    else:
-                        self.handle_join(client_id, params[0])
-                case "grouppost":
-                    if len(params) < 3:
-                        client_socket.send("Error: Missing group, subject, or message.".encode())
-                        break
-                    self.handle_post(client_id, *params)
-                case "groupusers":
-                    if len(params) < 1 or params[0] not in self.groups:
-                        client_socket.send("Error: Invalid group name".encode())
-                        break
-                    # Ensure client is part of group
-                    if client_name not in self.groups[params[0]]:
-                        client_socket.send(f"Error: Client not member of group '{params[0]}'.".encode())
-                        break
-                    group_users = ", ".join(self.groups[params[0]])
-                    client_socket.send((f"Users in '{params[0]}': " + group_users).encode())
-                case "groupleave":
-                    if len(params) < 1 or params[0] not in self.groups:
-                        client_socket.send("Error: Invalid group name.".encode())
-                        break
-                    self.handle_leave(client_id, params[0])
-                case "groupmessage":
-                    if len(params) < 2:
-                        client_socket.send("Error: Missing group ID or message ID.".encode())
-                        break
-                    self.handle_message(client_id, *params)
-                case _:
-                    client_socket.send("Invalid command.".encode())
-
-    def add_clients_groups(self, client_id, client_name, client_group, client_socket):
+            # Announce that a client has been connected.
+            print("A client with ID #%d has connected, waiting for queries." % (client_id))
+
+            # Manage client, group, and board data
+            self.add_clients_groups(client_id, client_name, client_group, writer)
+
+            # Broadcast to all clients that a new client has joined
+            self.broadcast_client_join(client_id, client_name)
+
+            # List up to 5 groups when a user connects
+            example_groups = list(self.groups)[0:5]
+            if len(example_groups) > 0:
+                example_groups_message = " Current server groups: " + ", ".join(example_groups)
+                if len(self.groups) > 5:
+                    example_groups_message += "..."
+
+            # Send client ID to client to confirm connection + exmaple groups
+            writer.write(frame_message(("id " + str(client_id) + example_groups_message).encode()))
+            await writer.drain()
+
+            # Handle client requests
+            async for frame in frames:
+                # Dispatch on the raw command and only decode its parameters
+                command, _, arguments = frame.partition(b" ")
+                try:
+                    params = arguments.decode().split(" ", PARAM_SPLITS.get(command, -1)) if arguments else []
+                except UnicodeDecodeError:
+                    # Parameters that aren't valid UTF-8 can't be a valid command.
+                    command, params = None, []
+                handler = self.dispatch.get(command, self._cmd_invalid)
+                keep_open = handler(client_id, writer, params)
+                # Yield to other clients until the response has been flushed.
+                await writer.drain()
+                if not keep_open:
+                    break
+        except ConnectionError:
+            # The connection was reset.
+            pass
+        finally:
+            del self.connections[task]
+            # The client sent %exit, closed the connection, or its handler failed.
+            client = self.connected_clients.pop(client_id, None)
+            if client is not None:
+                print("A client with ID #%d has disconnected from the server." % (client_id))
+                self.name_clients[client["name"]].discard(client_id)
+                if not self.name_clients[client["name"]]:
+                    del self.name_clients[client["name"]]
+                for group_clients in self.group_sockets.values():
+                    group_clients.discard(client_id)
+            # Close the client connection. Not waited on, as the event loop may
+            # already be shutting down.
+            writer.close()
+        # Return 0. This ends the coroutine for the current client.
+        return 0
+
+    # Command handlers. Each takes the client ID, its writer, and the command
+    # parameters, and returns False once the connection should be closed.
+
+    def _cmd_help(self, client_id, writer, params):
+        writer.write(frame_message(HELP_MSG_BYTES))
+        return True
+
+    def _cmd_join(self, client_id, writer, params):
+        self.handle_join(client_id, "default")
+        return True
+
+    def _cmd_post(self, client_id, writer, params):
+        if len(params) < 2:
+            writer.write(frame_message(MISSING_POST_ARGS_BYTES))
+        else:
+            self.handle_post(client_id, "default", *params)
+        return True
+
+    def _cmd_users(self, client_id, writer, params):
+        group_users = ", ".join(sorted(self.groups["default"]))
+        writer.write(frame_message(("Users in 'default': " + group_users).encode()))
+        return True
+
+    def _cmd_leave(self, client_id, writer, params):
+        self.handle_leave(client_id, "default")
+        return True
+
+    def _cmd_message(self, client_id, writer, params):
+        if len(params) < 1:
+            writer.write(frame_message(MISSING_MESSAGE_ID_BYTES))
+        else:
+            self.handle_message(client_id, "default", params[0])
+        return True
+
+    def _cmd_exit(self, client_id, writer, params):
+        # Remove the current user from the server once the loop ends.
+        writer.write(frame_message(DISCONNECTED_BYTES))
+        return False
+
+    def _cmd_groups(self, client_id, writer, params):
+        writer.write(frame_message(b"Available groups: " + ", ".join(self.groups).encode()))
+        return True
+
+    def _cmd_groupjoin(self, client_id, writer, params):
+        if len(params) != 1:
+            writer.write(frame_message(MISSING_GROUPJOIN_ARGS_BYTES))
+        else:
+            self.handle_join(client_id, params[0])
+        return True
+
+    def _cmd_grouppost(self, client_id, writer, params):
+        if len(params) < 3:
+            writer.write(frame_message(MISSING_GROUPPOST_ARGS_BYTES))
+        else:
+            self.handle_post(client_id, *params)
+        return True
+
+    def _cmd_groupusers(self, client_id, writer, params):
+        if len(params) < 1 or params[0] not in self.groups:
+            writer.write(frame_message(INVALID_GROUP_BYTES))
+        # Ensure client is part of group
+        elif self.connected_clients[client_id]["name"] not in self.groups[params[0]]:
+            writer.write(frame_message(f"Error: Client not member of group '{params[0]}'.".encode()))
+        else:
+            group_users = ", ".join(sorted(self.groups[params[0]]))
+            writer.write(frame_message((f"Users in '{params[0]}': " + group_users).encode()))
+        return True
+
+    def _cmd_groupleave(self, client_id, writer, params):
+        if len(params) < 1 or params[0] not in self.groups:
+            writer.write(frame_message(INVALID_GROUP_BYTES))
+        else:
+            self.handle_leave(client_id, params[0])
+        return True
+
+    def _cmd_groupmessage(self, client_id, writer, params):
+        if len(params) < 2:
+            writer.write(frame_message(MISSING_GROUPMESSAGE_ARGS_BYTES))
+        else:
+            self.handle_message(client_id, params[0], params[1])
+        return True
+
+    def _cmd_invalid(self, client_id, writer, params):
+        writer.write(frame_message(INVALID_COMMAND_BYTES))
+        return True
+
+    def add_clients_groups(self, client_id, client_name, client_group, writer):
         """Add the client to the list of users in a group.
         All users are added to the group "default" unless a group name is specified.
         The list of users in a group is saved on shutdown and recalled on boot as
@@ -209,150 +423,166 @@ class Server:
             2. use the %groupleave command.
         Users can be in multiple groups.
         """
-        with self.lock:
-            # Increment client_ids for the next client
-            self.client_ids += 1
-
-            # Add client to the connected clients list
-            self.connected_clients[client_id] = {
-                "name": client_name,
-                "group": client_group,
-                "client_socket": client_socket,
-            }
-
-            # GROUPS
-            # If the user supplied a group on connect that doesn't exist, create the group.
-            if client_group not in self.groups.keys():
-                self.groups[client_group] = [client_name]
-            # If user supplied group on connect that does exist, add them to the group.
-            elif client_name not in self.groups[client_group]:
-                self.groups[client_group].append(client_name)
-
-            # BOARDS
-            # Create a board for default if it doesn't exist yet
-            if "default" not in self.boards.keys():
-                self.boards["default"] = {}
-            # Add blank boards for all groups that don't have a board yet
-            for group in self.groups.keys():
-                if group not in self.boards.keys():
-                    self.boards[group] = {}
+        # Increment client_ids for the next client
+        self.client_ids += 1
+
+        # Add client to the connected clients list
+        self.connected_clients[client_id] = {
+            "name": client_name,
+            "group": client_group,
+            "writer": writer,
+        }
+        self.name_clients.setdefault(client_name, set()).add(client_id)
+
+        # GROUPS
+        # If the user supplied a group on connect that doesn't exist, create the group.
+        if client_group not in self.groups.keys():
+            self.groups[client_group] = {client_name}
+            self.log_change({"op": "join", "group": client_group, "name": client_name})
+        # If user supplied group on connect that does exist, add them to the group.
+        elif client_name not in self.groups[client_group]:
+            self.groups[client_group].add(client_name)
+            self.log_change({"op": "join", "group": client_group, "name": client_name})
+
+        # Index every connection with this username under every group the user is a member of
+        for group, members in self.groups.items():
+            if client_name in members:
+                self.group_sockets.setdefault(group, set()).update(self.name_clients[client_name])
+
+        # BOARDS
+        # Create a board for default if it doesn't exist yet
+        if "default" not in self.boards.keys():
+            self.boards["default"] = {}
+        # Add blank boards for all groups that don't have a board yet
+        for group in self.groups.keys():
+            if group not in self.boards.keys():
+                self.boards[group] = {}
 
     def broadcast_client_join(self, client_id, client_name):
         """Broadcast to all clients that a new client has joined."""
-        with self.lock:
-            encodedMessage = str(
-                "%s has joined the server (client ID #%d). "
-                % (client_name, client_id)
-            ).encode()
-            for cid, client in self.connected_clients.items():
-                # Exclude the current connected client
-                if cid != client_id:
-                    # Print to all other clients on their socket that *this* client has joined with its information
-                    client["client_socket"].send(encodedMessage)
+        # Frame the message once and queue the same payload for every recipient
+        payload = frame_message(str(
+            "%s has joined the server (client ID #%d). "
+            % (client_name, client_id)
+        ).encode())
+        for cid, client in self.connected_clients.items():
+            # Exclude the current connected client
+            if cid != client_id:
+                # Print to all other clients on their socket that *this* client has joined with its information
+                client["writer"].write(payload)
     
     def handle_join(self, client_id, group):
-        with self.lock:
-            client_name = self.connected_clients[client_id]["name"]
-            client_socket = self.connected_clients[client_id]["client_socket"]
-            if group not in self.groups.keys():
-                # Add new group and board.
-                self.groups[group] = [client_name]
-                self.boards[group] = {}
-                client_socket.send(f"Added to new group '{group}'.".encode())
-                return
+        client_name = self.connected_clients[client_id]["name"]
+        writer = self.connected_clients[client_id]["writer"]
+        if group not in self.groups.keys():
+            # Add new group and board.
+            self.groups[group] = {client_name}
+            self.group_sockets[group] = set(self.name_clients[client_name])
+            self.boards[group] = {}
+            self.log_change({"op": "join", "group": group, "name": client_name})
+            writer.write(frame_message(f"Added to new group '{group}'.".encode()))
+            return
+        else:
+            if client_name in self.groups[group]:
+                writer.write(frame_message(f"Already part of group '{group}'.".encode()))
             else:
-                if client_name in self.groups[group]:
-                    client_socket.send(f"Already part of group '{group}'.".encode())
+                self.groups[group].add(client_name)
+                self.group_sockets.setdefault(group, set()).update(self.name_clients[client_name])
+                self.log_change({"op": "join", "group": group, "name": client_name})
+                # Broadcast new message to all clients in the group
+                payload = frame_message(f"New member {client_name} has joined group '{group}'.".encode())
+                for cid in self.group_sockets[group]:
+                    info = self.connected_clients[cid]
+                    if info["name"] != client_name:
+                        info["writer"].write(payload)
+                
+                if len(self.boards[group]) > 0:
+                    sorted_items = sorted(self.boards[group].keys())
+                    last_two_items = sorted_items[-2:]
+                    messages_text = "\nPrevious messages:\n"
+                    for key in last_two_items:
+                        messages_text += f"Message ID: {key} + \n"
                 else:
-                    self.groups[group].append(client_name)
-                    # Broadcast new message to all clients in the group
-                    for cid, info in self.connected_clients.items():
-                        if info["name"] is not client_name and info["name"] in self.groups[group]:
-                            info["client_socket"].send(f"New member {client_name} has joined group '{group}'.".encode())
-                    
-                    if len(self.boards[group]) > 0:
-                        sorted_items = sorted(self.boards[group].keys())
-                        last_two_items = sorted_items[-2:]
-                        messages_text = "\nPrevious messages:\n"
-                        for key in last_two_items:
-                            messages_text += f"Message ID: {key} + \n"
-                    else:
-                        messages_text = "\nNo previous messages."
-                    
-                    return_message = f"Added to group '{group}'.\nCurrent Members: " + ", ".join(self.groups[group]) + messages_text
-                    client_socket.send(return_message.encode())
-
-    def handle_post(self, client_id, group, subject, *message):
+                    messages_text = "\nNo previous messages."
+                
+                return_message = f"Added to group '{group}'.\nCurrent Members: " + ", ".join(sorted(self.groups[group])) + messages_text
+                writer.write(frame_message(return_message.encode()))
+
+    def handle_post(self, client_id, group, subject, message):
         """Post a message to a group's board with a given subject and message. Notifies all group members of post."""
-        with self.lock:
-            # Ensure client is part of group
-            sender_name = self.connected_clients[client_id]["name"]
-            if not sender_name in self.groups[group]:
-                self.connected_clients[client_id]["client_socket"].send("Error: Client not member of group.".encode())
-                return
-            
-            print( self.groups[group])
-            message_id = len(self.boards[group])
-            self.boards[group][message_id] = {
-                "sender": sender_name,
-                "date": datetime.datetime.now().date(),
-                "subject": subject,
-                "message": " ".join(message),
-                "users_at_time_of_posting": copy.deepcopy(self.groups[group]),
-            }
-            # Broadcast new message to all clients in the group
-            for cid, info in self.connected_clients.items():
-                if info["name"] in self.groups[group]:
-                    info["client_socket"].send(f"New message posted in {group} by {sender_name} with ID#{message_id}.".encode())
+        # Ensure client is part of group
+        sender_name = self.connected_clients[client_id]["name"]
+        if not sender_name in self.groups.get(group, ()):
+            self.connected_clients[client_id]["writer"].write(frame_message(NOT_MEMBER_BYTES))
+            return
+        
+        print( self.groups[group])
+        message_id = len(self.boards[group])
+        self.boards[group][message_id] = {
+            "sender": sender_name,
+            "date": date.today().isoformat(),
+            "subject": subject,
+            "message": message,
+            "users_at_time_of_posting": frozenset(self.groups[group]),
+        }
+        self.log_change({"op": "post", "group": group, "id": message_id, "msg": self.boards[group][message_id]})
+        # Broadcast new message to all clients in the group
+        payload = frame_message(f"New message posted in {group} by {sender_name} with ID#{message_id}.".encode())
+        for cid in self.group_sockets.get(group, ()):
+            self.connected_clients[cid]["writer"].write(payload)
 
     def handle_message(self, client_id, group, message_id):
         """View a message from a group's board with a given message ID."""
-        client_socket = self.connected_clients[client_id]["client_socket"]
+        writer = self.connected_clients[client_id]["writer"]
 
         # Ensure client is part of group
         sender_name = self.connected_clients[client_id]["name"]
-        if not sender_name in self.groups[group]:
-            client_socket.send("Error: Client not member of group.".encode())
+        if not sender_name in self.groups.get(group, ()):
+            writer.write(frame_message(NOT_MEMBER_BYTES))
             return
         
         # Ensure message exists
+        board = self.boards[group]
         try:
-            message = self.boards[group][int(message_id)]
-            if message is not None:
-                if sender_name not in self.boards[group][int(message_id)]['users_at_time_of_posting']:
-                    # Check if they're in the list of members two posts from now.
-                    if (sender_name in self.boards[group][int(message_id)]['users_at_time_of_posting']):
-                        encodedMessage = f"{message['sender']} on {message['date']} ({message['subject']}): {message['message']}".encode()
-                        client_socket.send(encodedMessage)
-                    else:
-                        client_socket.send("Error: You are trying to access a message from too far in the past from when you joined the current group. (Limit: 2)".encode())
-                else:
-                    encodedMessage = f"{message['sender']} on {message['date']} ({message['subject']}): {message['message']}".encode()
-                    client_socket.send(encodedMessage)
-            else:
-                raise Exception
-        except Exception as e:
-            client_socket.send("Error: Message ID does not exist.".encode())
+            message_id = int(message_id)
+            message = board[message_id]
+        except (KeyError, ValueError):
+            writer.write(frame_message(MESSAGE_NOT_FOUND_BYTES))
+            return
+
+        if sender_name not in message['users_at_time_of_posting']:
+            # Members can read up to 2 posts from before they joined. Check if they're
+            # in the list of members within the next two posts (message IDs are sequential).
+            later_ids = [key for key in (message_id + 1, message_id + 2) if key in board]
+            if len(later_ids) == 2 and not any(
+                sender_name in board[key]['users_at_time_of_posting'] for key in later_ids
+            ):
+                writer.write(frame_message(MESSAGE_TOO_OLD_BYTES))
+                return
+
+        encodedMessage = f"{message['sender']} on {message['date']} ({message['subject']}): {message['message']}".encode()
+        writer.write(frame_message(encodedMessage))
 
     def handle_leave(self, client_id, group):
         """Removes a user from a given group. Notifies all group members that user has left."""
-        with self.lock:
-            client_socket = self.connected_clients[client_id]["client_socket"]
-            
-            # Ensure client is part of group
-            sender_name = self.connected_clients[client_id]["name"]
-            if not sender_name in self.groups[group]:
-                client_socket.send(f"Error: Client not member of group '{group}'.".encode())
-                return
-            
-            # Remove client from group
-            self.groups[group].remove(sender_name)
-            client_socket.send(f"You have left group '{group}'.".encode())
-
-            # Broadcast leave message to all clients in the group
-            for cid, info in self.connected_clients.items():
-                if info["name"] in self.groups[group]:
-                    info["client_socket"].send(f"User {sender_name} has left group '{group}'.".encode())
+        writer = self.connected_clients[client_id]["writer"]
+        
+        # Ensure client is part of group
+        sender_name = self.connected_clients[client_id]["name"]
+        if not sender_name in self.groups[group]:
+            writer.write(frame_message(f"Error: Client not member of group '{group}'.".encode()))
+            return
+        
+        # Remove client from group
+        self.groups[group].remove(sender_name)
+        self.group_sockets[group].difference_update(self.name_clients[sender_name])
+        self.log_change({"op": "leave", "group": group, "name": sender_name})
+        writer.write(frame_message(f"You have left group '{group}'.".encode()))
+
+        # Broadcast leave message to all clients in the group
+        payload = frame_message(f"User {sender_name} has left group '{group}'.".encode())
+        for cid in self.group_sockets[group]:
+            self.connected_clients[cid]["writer"].write(payload)
 
 
 def main():